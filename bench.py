@@ -0,0 +1,181 @@
+"""Benchmarks for LogSec.
+
+Runs against a scratch SQLite database by default, or any SQLAlchemy URL given with --url.
+Rows created by a benchmark are removed when it finishes.
+
+Usage: python bench.py {coalesce,lookup,breaker} [--url URL] [--count N]
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from sqlalchemy import create_engine, inspect, select, event
+from sqlalchemy.orm import Session
+from sqlalchemy import MetaData, Table, Column, Integer, VARCHAR, CHAR, Date
+
+from logsec_discord import LogSec, RegistrationCoalescer, DatabaseUnavailable
+
+def create_ls_players(engine):
+    """Creates a minimal LoginSecurity player table, for databases LoginSecurity hasn't set up.
+    """
+    if inspect(engine).has_table("ls_players"):
+        return
+    metadata = MetaData()
+    Table(
+        "ls_players", metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("unique_user_id", VARCHAR(128), unique=True, nullable=False),
+        Column("last_name", VARCHAR(16)),
+        Column("password", VARCHAR(512)),
+        Column("hashing_algorithm", Integer),
+        Column("registration_date", Date),
+        Column("optlock", Integer),
+        Column("uuid_mode", CHAR(1))
+    )
+    metadata.create_all(engine)
+
+def open_logsec(url):
+    engine = create_engine(url)
+    create_ls_players(engine)
+    # Lowest cost, so hashing doesn't drown out the database.
+    return LogSec(None, None, None, None, None, bcrypt_cost=4, engine=engine)
+
+def registrations(run, count):
+    return [(f"9{run}{i:08d}", f"bench{run}x{i}", "benchpass") for i in range(count)]
+
+async def bench_coalesce(logsec, count, concurrency, window, max_batch):
+    """Registers count users, concurrency at a time, one transaction each and then coalesced.
+    """
+
+    async def run(register, entries):
+        semaphore = asyncio.Semaphore(concurrency)
+        async def one(entry):
+            async with semaphore:
+                await register(*entry)
+        start = time.perf_counter()
+        await asyncio.gather(*(one(entry) for entry in entries))
+        elapsed = time.perf_counter() - start
+        logsec.unregister_many([discord_id for discord_id, _, _ in entries])
+        return elapsed
+
+    async def single(discord_id, mc_username, password):
+        await asyncio.to_thread(logsec.register, discord_id, mc_username, password)
+
+    coalescer = RegistrationCoalescer(logsec, window=window, max_batch=max_batch)
+
+    for name, register, run_id in (("one transaction each", single, 1), ("coalesced", coalescer.register, 2)):
+        elapsed = await run(register, registrations(run_id, count))
+        print(f"{name:>22}: {count} registrations in {elapsed:.3f}s, {count / elapsed:.1f}/s")
+
+def bench_lookup(logsec, count):
+    """Looks up one registered Discord user count times, building statements per call and precompiled.
+    """
+
+    def built_per_call(discord_id):
+        # How LogSec.lookup_discord used to run: a fresh construct, Session and ORM result mapping per call.
+        with Session(logsec.engine) as session:
+            return session.execute(
+                select(
+                    logsec.Registration.c.discord_id,
+                    logsec.LogSecPlayers.c.last_name,
+                    logsec.LogSecPlayers.c.registration_date
+                )
+                .join_from(logsec.Registration, logsec.LogSecPlayers)
+                .where(logsec.Registration.c.discord_id==discord_id)
+            ).mappings().all()
+
+    entries = registrations(3, 1)
+    logsec.register(*entries[0])
+    discord_id = entries[0][0]
+
+    try:
+        for name, lookup in (("built per call", built_per_call), ("precompiled", logsec.lookup_discord)):
+            lookup(discord_id)
+            start = time.perf_counter()
+            for _ in range(count):
+                lookup(discord_id)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>22}: {count} lookups in {elapsed:.3f}s, {elapsed / count * 1e6:.1f} us/lookup")
+    finally:
+        logsec.unregister_many([discord_id])
+
+class FakeOutage:
+    """Makes every statement on an engine fail, or stall and then fail like a read timeout, while set.
+    """
+
+    def __init__(self, engine):
+        self.mode = None
+        self.delay = 0
+        event.listen(engine, "do_execute", self._do_execute)
+        event.listen(engine, "do_executemany", self._do_execute)
+
+    def _do_execute(self, cursor, statement, parameters, context):
+        if self.mode == "slow":
+            time.sleep(self.delay)
+        if self.mode is not None:
+            # Raised as the driver's own error with MySQL's "lost connection" code, so SQLAlchemy wraps it
+            # and the breaker counts it like a real outage.
+            raise context.dialect.loaded_dbapi.OperationalError(2013, f"fake {self.mode} database")
+
+def bench_breaker(logsec, delay, failure_threshold, reset_timeout):
+    """Walks the circuit breaker through an outage of a slow database and its recovery.
+    """
+
+    logsec.breaker.failure_threshold = failure_threshold
+    logsec.breaker.reset_timeout = reset_timeout
+    outage = FakeOutage(logsec.engine)
+
+    def lookup(label):
+        start = time.perf_counter()
+        try:
+            logsec.lookup_discord("0")
+            outcome = "ok"
+        except DatabaseUnavailable:
+            outcome = "unavailable"
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:>26}: {outcome:<11} in {elapsed:7.1f} ms, breaker {logsec.breaker.state}")
+
+    lookup("healthy")
+    outage.mode, outage.delay = "slow", delay
+    for i in range(failure_threshold + 2):
+        lookup(f"slow database #{i + 1}")
+    time.sleep(reset_timeout)
+    lookup("probe, still down")
+    lookup("after failed probe")
+    outage.mode = None
+    lookup("recovered, breaker open")
+    time.sleep(reset_timeout)
+    lookup("probe, recovered")
+    lookup("healthy again")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=["coalesce", "lookup", "breaker"])
+    parser.add_argument("--url", help="SQLAlchemy database URL, defaults to a scratch SQLite database")
+    parser.add_argument("--count", type=int, default=500, help="Operations per run")
+    parser.add_argument("--concurrency", type=int, default=32, help="Registrations in flight at once")
+    parser.add_argument("--window-ms", type=float, default=5, help="Coalescing window in milliseconds")
+    parser.add_argument("--batch-size", type=int, default=64, help="Most registrations per coalesced transaction")
+    parser.add_argument("--delay-ms", type=float, default=200, help="How long the fake slow database stalls")
+    parser.add_argument("--failure-threshold", type=int, default=3, help="Failures in a row that open the breaker")
+    parser.add_argument("--reset-timeout", type=float, default=1, help="Seconds before the breaker probes again")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        logsec = open_logsec(args.url or f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+        if args.benchmark == "coalesce":
+            asyncio.run(bench_coalesce(logsec, args.count, args.concurrency, args.window_ms / 1000, args.batch_size))
+        elif args.benchmark == "lookup":
+            bench_lookup(logsec, args.count)
+        elif args.benchmark == "breaker":
+            bench_breaker(logsec, args.delay_ms / 1000, args.failure_threshold, args.reset_timeout)
+        logsec.engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 import logging
 import os
+import time
 import asyncio
+from datetime import date
 from dotenv import load_dotenv
 from tabulate import tabulate
 
-from logsec_discord import LogSec
+from logsec_discord import LogSec, RegistrationCoalescer, AuditWriter, DuplicateError, DatabaseUnavailable
+from logsec_discord import calibrate_bcrypt
 from utils import BanFile, AdminFile, RegFile
 
 load_dotenv()
@@ -28,6 +31,9 @@ cog_loaded = False
 
 class CustomCheckFailure(commands.CheckFailure):
     pass
+    
+class PrivilegeCheckFailure(CustomCheckFailure):
+    pass
 
 ### CHECKS AND EVENTS
 
@@ -54,6 +60,9 @@ async def on_ready():
 @bot.event    
 async def on_command_error(ctx, error):
     if isinstance(error, CustomCheckFailure):
+        # Recorded here rather than in the checks, which help also runs to filter commands.
+        if isinstance(error, PrivilegeCheckFailure) and ctx.command is not None:
+            record_audit(ctx, 'denied', detail=ctx.command.qualified_name)
         await ctx.reply(error)
         return
     elif isinstance(error, commands.errors.CheckFailure):
@@ -64,6 +73,14 @@ async def on_command_error(ctx, error):
     elif isinstance(error, commands.MissingRequiredArgument):
         await ctx.reply(f"You left out the `{error.param.name}` argument.")
         return
+    
+    # Unwrap errors raised inside commands, for both prefix and slash invocations.
+    original = error
+    while hasattr(original, 'original'):
+        original = original.original
+    if isinstance(original, DatabaseUnavailable):
+        await ctx.reply("The database is unavailable right now. Try again in a bit.")
+        return
     raise error
     
 @bot.check
@@ -83,7 +100,7 @@ def is_privileged():
     async def predicate(ctx):
         is_privileged = ctx.message.author.id in ADMINS or ctx.message.author.id == ctx.bot.application.owner.id
         if not is_privileged:
-            raise CustomCheckFailure(
+            raise PrivilegeCheckFailure(
                 f"Wha- hey! This command is off-limits! This incident will be reported."
             )
         return is_privileged
@@ -106,7 +123,7 @@ def is_owner():
     async def predicate(ctx):
         is_owner = ctx.message.author.id == ctx.bot.application.owner.id
         if not is_owner:
-            raise CustomCheckFailure(f"Who are you and why are you fiddling with an owner-only command!?")
+            raise PrivilegeCheckFailure(f"Who are you and why are you fiddling with an owner-only command!?")
         return is_owner
     return commands.check(predicate)
     
@@ -129,14 +146,14 @@ class UserCog(commands.Cog, name="User"):
             return
 
         discord_id = str(ctx.message.author.id)
-        result = LOGSEC.lookup_discord(discord_id)
+        result = await asyncio.to_thread(LOGSEC.lookup_discord, discord_id)
         if result:
             await ctx.reply(
-                f"You have already registered with username {result[0]['last_name']} on {result[0]['registration_date']}."
+                f"You have already registered with username {result[0].last_name} on {result[0].registration_date}."
             )
             return
 
-        result = LOGSEC.lookup_username(username)
+        result = await asyncio.to_thread(LOGSEC.lookup_username, username)
         if result:
             await ctx.reply("How original -- the username is already taken. Register a different username.")
             return
@@ -183,14 +200,25 @@ class UserCog(commands.Cog, name="User"):
             return
 
         # Mitigate race condition
-        if LOGSEC.lookup_discord(discord_id) or LOGSEC.lookup_username(username):
+        if (await asyncio.to_thread(LOGSEC.lookup_discord, discord_id)
+                or await asyncio.to_thread(LOGSEC.lookup_username, username)):
             await message.edit(content=(
                 f"Too slow! Someone has snapped up your username, {username}, during registration. "
                 "Or, you are trying to mess with me. Either way, use a different username."
                 ))
             return
 
-        LOGSEC.register(discord_id, username, user_reply.content)
+        try:
+            if COALESCER:
+                await COALESCER.register(discord_id, username, user_reply.content)
+            else:
+                await asyncio.to_thread(LOGSEC.register, discord_id, username, user_reply.content)
+        except DuplicateError:
+            await message.edit(content=(
+                f"Too slow! Someone has snapped up your username, {username}, during registration. "
+                "Or, you are trying to mess with me. Either way, use a different username."
+                ))
+            return
         
         await message.edit(content=f"Your username, {username}, has been registered.")
 
@@ -214,7 +242,7 @@ class UserCog(commands.Cog, name="User"):
         if '<@' in discord_id:
             discord_id = discord_id[2:-1]
 
-        result = LOGSEC.lookup_discord(discord_id)
+        result = await asyncio.to_thread(LOGSEC.lookup_discord, discord_id)
         if not result:
             await ctx.reply("User isn't registered.")
             return 
@@ -226,8 +254,31 @@ class UserCog(commands.Cog, name="User"):
         name = user.name
         disc = user.discriminator
         
-        LOGSEC.unregister(discord_id)
-        await ctx.reply(f"Bye-bye {result[0]['last_name']}, <@{discord_id}> unregistered.")
+        await asyncio.to_thread(LOGSEC.unregister, discord_id)
+        record_audit(ctx, 'unregister', discord_id, result[0].last_name)
+        await ctx.reply(f"Bye-bye {result[0].last_name}, <@{discord_id}> unregistered.")
+        
+    @unregister.command(name='many')
+    @is_privileged()
+    async def unregister_many(self, ctx, *, targets = commands.param(
+        description="Discord user IDs or mentions, or a registration date range YYYY-MM-DD..YYYY-MM-DD")):
+        """Unregisters many Discord users' Minecraft usernames from server
+        
+        Usage: unregister many <discord_id> [<discord_id>...] | <start_date>..<end_date>
+        """
+        
+        try:
+            discord_ids = await resolve_targets(targets)
+        except ValueError as e:
+            await ctx.reply(f"Couldn't make sense of that. {e}")
+            return
+            
+        message = await ctx.reply("Hold on for a moment...")
+        removed = await asyncio.to_thread(LOGSEC.unregister_many, discord_ids)
+        for row in removed:
+            record_audit(ctx, 'unregister', row['discord_id'], row['last_name'])
+        
+        await message.edit(content=f"Unregistered {len(removed)} of {len(discord_ids)} users.")
         
     @commands.hybrid_group(fallback='self', name='status', invoke_without_command=True)
     async def status(self, ctx):
@@ -258,14 +309,14 @@ class UserCog(commands.Cog, name="User"):
         
         reply += f"User: <@{discord_id}>\n"
         
-        result = LOGSEC.lookup_discord(discord_id)
+        result = await asyncio.to_thread(LOGSEC.lookup_discord, discord_id)
         status = 'Banned' if discord_id in BANNED else 'Registered' if result else 'Unregistered'    
         reply += f"Status: {status}\n" 
         
         if status == 'Registered':
             reply += (
-                f"Minecraft username: {result[0]['last_name']}\n" 
-                f"Date registered: {result[0]['registration_date']}"
+                f"Minecraft username: {result[0].last_name}\n" 
+                f"Date registered: {result[0].registration_date}"
             )
         
         await ctx.reply(reply)
@@ -273,6 +324,81 @@ class UserCog(commands.Cog, name="User"):
 class AdminCog(commands.Cog, name="Administrative"):
     """Commands expected to be used by administrators.
     """
+    
+    def __init__(self):
+        self.reconcile_lock = asyncio.Lock()
+        self.last_reconcile = None
+        
+    async def cog_load(self):
+        AUDIT.start()
+        if RECONCILE_INTERVAL > 0:
+            self.reconcile_loop.change_interval(seconds=RECONCILE_INTERVAL)
+            self.reconcile_loop.start()
+        if USERNAME_FILTER_FP_RATE > 0 and USERNAME_FILTER_REBUILD > 0:
+            self.username_filter_loop.change_interval(seconds=USERNAME_FILTER_REBUILD)
+            self.username_filter_loop.start()
+            
+    async def cog_unload(self):
+        self.reconcile_loop.cancel()
+        self.username_filter_loop.cancel()
+        # Cogs are removed when the bot closes, including on SIGINT, so this writes out the last entries.
+        await AUDIT.close()
+        
+    @tasks.loop(hours=1)
+    async def username_filter_loop(self):
+        # Picks up players created in-game and drops unregistered ones.
+        try:
+            await asyncio.to_thread(LOGSEC.build_username_filter, USERNAME_FILTER_FP_RATE)
+        except DatabaseUnavailable as e:
+            logging.warning(f"Skipped username filter rebuild. {e}")
+        except Exception:
+            # An unhandled exception would stop the loop for good, so log it and try again next interval.
+            logging.exception("Username filter rebuild failed.")
+        
+    @username_filter_loop.before_loop
+    async def before_username_filter_loop(self):
+        # Built at startup already.
+        await asyncio.sleep(USERNAME_FILTER_REBUILD)
+        
+    @tasks.loop(hours=1)
+    async def reconcile_loop(self):
+        try:
+            await self.run_reconcile()
+        except DatabaseUnavailable as e:
+            logging.warning(f"Skipped reconciliation pass. {e}")
+        except Exception:
+            # An unhandled exception would stop the loop for good, so log it and try again next interval.
+            logging.exception("Reconciliation pass failed.")
+        
+    @reconcile_loop.before_loop
+    async def before_reconcile_loop(self):
+        # Don't sweep at the same time as startup.
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        
+    async def run_reconcile(self):
+        """Walks lgds_registration page by page and repairs orphaned, banned and drifted registrations.
+        
+        Pages are checked off the event loop, with a pause between them, to stay out of the way of commands.
+        """
+        
+        async with self.reconcile_lock:
+            report = {"scanned": 0, "orphaned": 0, "banned": 0, "drifted": 0, "drift_reported": 0}
+            banned = frozenset(BANNED.banned)
+            start = time.monotonic()
+            after = None
+            while True:
+                after, counts = await asyncio.to_thread(LOGSEC.reconcile, banned, after, RECONCILE_CHUNK)
+                for key, value in counts.items():
+                    report[key] += value
+                if after is None:
+                    break
+                await asyncio.sleep(RECONCILE_PAUSE)
+            report["elapsed"] = time.monotonic() - start
+            report["finished"] = discord.utils.utcnow()
+            
+            logging.info(f"Reconciliation pass done: {report}")
+            self.last_reconcile = report
+            return report
 
     @commands.hybrid_command(name='open')    
     @is_privileged()
@@ -286,6 +412,7 @@ class AdminCog(commands.Cog, name="Administrative"):
             await ctx.reply("User registration is already open.")
         else:
             REG.open()
+            record_audit(ctx, 'open')
             await ctx.reply("User registration is now open.")
 
     @commands.hybrid_command(name='close')  
@@ -300,6 +427,7 @@ class AdminCog(commands.Cog, name="Administrative"):
             await ctx.reply("User registration is already closed.")
         else:
             REG.close()
+            record_audit(ctx, 'close')
             await ctx.reply("User registration is now closed.")
             
     @commands.hybrid_command(name='ban')  
@@ -319,7 +447,8 @@ class AdminCog(commands.Cog, name="Administrative"):
             return
                 
         try:
-            LOGSEC.unregister(discord_id)
+            await asyncio.to_thread(LOGSEC.unregister, discord_id)
+            record_audit(ctx, 'unregister', discord_id)
         except KeyError:
             pass
         
@@ -327,6 +456,7 @@ class AdminCog(commands.Cog, name="Administrative"):
             await ctx.reply(f"<@{discord_id}> is already banned.")
         else:
             BANNED.ban(discord_id)
+            record_audit(ctx, 'ban', discord_id)
             await ctx.reply(f"<@{discord_id}> is banned from registering or playing.")
         
     @commands.hybrid_command(name='unban')   
@@ -349,8 +479,60 @@ class AdminCog(commands.Cog, name="Administrative"):
             await ctx.reply(f"<@{discord_id}> isn't banned to begin with.")
         else:
             BANNED.unban(discord_id)
+            record_audit(ctx, 'unban', discord_id)
             await ctx.reply(f"<@{discord_id}> is unbanned.")
             
+    @commands.hybrid_command(name='massban')
+    @is_privileged()
+    async def massban(self, ctx, *, targets = commands.param(
+        description="Discord user IDs or mentions, or a registration date range YYYY-MM-DD..YYYY-MM-DD")):
+        """Bans many users from registration and removes their registrations
+        
+        Usage: massban <discord_id> [<discord_id>...] | <start_date>..<end_date>
+        """
+        
+        try:
+            discord_ids = await resolve_targets(targets)
+        except ValueError as e:
+            await ctx.reply(f"Couldn't make sense of that. {e}")
+            return
+            
+        message = await ctx.reply("Hold on for a moment...")
+        removed = await asyncio.to_thread(LOGSEC.unregister_many, discord_ids)
+        banned = BANNED.ban_many(discord_ids)
+        for row in removed:
+            record_audit(ctx, 'unregister', row['discord_id'], row['last_name'])
+        for discord_id in banned:
+            record_audit(ctx, 'ban', discord_id)
+        
+        await message.edit(content=(
+            f"Banned {len(banned)} of {len(discord_ids)} users, "
+            f"{len(discord_ids) - len(banned)} were already banned. "
+            f"Removed {len(removed)} registrations."
+        ))
+        
+    @commands.hybrid_command(name='massunban')
+    @is_privileged()
+    async def massunban(self, ctx, *, targets = commands.param(description="Discord user IDs or mentions")):
+        """Unbans many users from registration
+        
+        Usage: massunban <discord_id> [<discord_id>...]
+        """
+        
+        try:
+            discord_ids = parse_discord_ids(targets)
+        except ValueError as e:
+            await ctx.reply(f"Couldn't make sense of that. {e}")
+            return
+        
+        unbanned = BANNED.unban_many(discord_ids)
+        for discord_id in unbanned:
+            record_audit(ctx, 'unban', discord_id)
+        await ctx.reply(
+            f"Unbanned {len(unbanned)} of {len(discord_ids)} users, "
+            f"{len(discord_ids) - len(unbanned)} weren't banned to begin with."
+        )
+            
     @commands.hybrid_command(name='banned')   
     @is_privileged()  
     async def banned(self, ctx):
@@ -379,9 +561,9 @@ class AdminCog(commands.Cog, name="Administrative"):
         
         reply = f"User registration is {'open' if REG.is_open else 'closed'}.\n"
 
-        registered = LOGSEC.registered
+        registered = await asyncio.to_thread(lambda: LOGSEC.registered)
         if registered:
-            registered = [list(row.values()) for row in registered]
+            registered = [list(row) for row in registered]
             for i, row in enumerate(registered):
                 discord_id = row[0]
                 user = await get_user(discord_id)
@@ -398,6 +580,75 @@ class AdminCog(commands.Cog, name="Administrative"):
             reply += "No registrations in database.\n"
             
         await message.edit(content=reply)
+        
+    @commands.hybrid_command(name='reconcile')
+    @is_privileged()
+    async def reconcile(self, ctx):
+        """Repairs orphaned, banned and drifted registrations now
+        
+        Usage: reconcile
+        """
+        
+        if self.reconcile_lock.locked():
+            # Wait for the running pass instead of starting another one right after it.
+            message = await ctx.reply("A reconciliation pass is already running, waiting for it to finish...")
+            async with self.reconcile_lock:
+                pass
+            report = self.last_reconcile
+        else:
+            message = await ctx.reply("Hold on for a moment...")
+            report = await self.run_reconcile()
+            
+        await message.edit(content=format_reconcile_report(report))
+            
+    @commands.hybrid_command(name='audit')
+    @is_privileged()
+    async def audit(self, ctx, page: int = commands.param(default=1, description="Page number, newest first"),
+            discord_id = commands.param(default=None, description="Only entries by or about this Discord user")):
+        """Shows the audit log of privileged actions
+        
+        Usage: audit [<page>] [<discord_id>]
+        """
+        
+        if page < 1:
+            await ctx.reply("Pages start at 1.")
+            return
+        if discord_id is not None and '<@' in discord_id:
+            discord_id = discord_id[2:-1]
+            
+        # Show what was recorded up to now.
+        await AUDIT.flush()
+        entries = await asyncio.to_thread(LOGSEC.audit_log, page, AUDIT_PAGE_SIZE, discord_id)
+        
+        if not entries:
+            await ctx.reply("No audit entries on this page.")
+            return
+            
+        rows = [
+            [e['id'], e['created_at'].strftime('%Y-%m-%d %H:%M'), e['actor_id'], e['action'], e['target'] or '', e['detail'] or '']
+            for e in entries
+        ]
+        table = tabulate(rows, headers=['#', 'Time (UTC)', 'Actor', 'Action', 'Target', 'Detail'])
+        await ctx.reply(f"Audit log, page {page}:\n```{table}```")
+        
+    @commands.hybrid_command(name='metrics')
+    @is_privileged()
+    async def metrics(self, ctx):
+        """Shows bot and database settings and statistics
+        
+        Usage: metrics
+        """
+        
+        reply = (
+            f"User registration is {'open' if REG.is_open else 'closed'}.\n"
+            f"Password hash cost: bcrypt $2a$, cost {LOGSEC.bcrypt_cost}\n"
+            f"Banned users: {len(BANNED.banned)}\n"
+            f"Administrators: {len(ADMINS.admins)}\n"
+            f"{format_username_filter()}\n"
+            f"{format_breaker()}\n\n"
+            f"{format_reconcile_report(self.last_reconcile)}"
+        )
+        await ctx.reply(reply)
             
 class OwnerCog(commands.Cog, name="Owner"):
     """Commands expected to be used by the owner of the bot.
@@ -423,6 +674,7 @@ class OwnerCog(commands.Cog, name="Owner"):
             await ctx.reply(f"<@{discord_id}> is already an admin.")
         else:
             ADMINS.promote(discord_id)
+            record_audit(ctx, 'promote', discord_id)
             await ctx.reply(f"<@{discord_id}> is promoted to admin.")
             
     @commands.hybrid_command(name='demote')  
@@ -445,6 +697,7 @@ class OwnerCog(commands.Cog, name="Owner"):
             await ctx.reply(f"<@{discord_id}> isn't an admin to begin with.")
         else:
             ADMINS.demote(discord_id)
+            record_audit(ctx, 'demote', discord_id)
             await ctx.reply(f"<@{discord_id}> is demoted.")
             
     @commands.hybrid_command(name='admins')   
@@ -463,6 +716,28 @@ class OwnerCog(commands.Cog, name="Owner"):
             admins = [f"{i}. <@{b}>" for i, b in enumerate(admins, 1)]
             await ctx.reply(f"Administrators:\n" + '\n'.join(admins))
     
+    @commands.hybrid_command(name='calibrate')
+    @is_owner()
+    async def calibrate(self, ctx, target_ms: int = commands.param(
+        default=250, description="Longest a password hash may take, in milliseconds")):
+        """Benchmarks password hashing and recommends a bcrypt cost
+        
+        Usage: calibrate [<target_ms>]
+        """
+        
+        message = await ctx.reply("Hold on for a moment, hashing passwords...")
+        cost, timings = await asyncio.to_thread(calibrate_bcrypt, target_ms)
+        
+        table = tabulate(
+            [[c, f"{ms:.1f}"] for c, ms in timings.items()], 
+            headers=['Cost', 'Milliseconds']
+        )
+        await message.edit(content=(
+            f"```{table}```\n"
+            f"Recommended cost for {target_ms} ms: {cost}. Current cost: {LOGSEC.bcrypt_cost}.\n"
+            f"Set BCRYPT_COST={cost} and restart to use it."
+        ))
+    
     @commands.command(name='sync') 
     @is_owner()      
     async def sync(self, ctx):
@@ -484,19 +759,109 @@ async def get_user(discord_id):
             pass
     return user
     
+def record_audit(ctx, action, target=None, detail=None):
+    AUDIT.record(ctx.message.author.id, action, target, detail)
+    
+def parse_discord_ids(targets):
+    """Returns unique Discord IDs from space or comma separated IDs and user mentions.
+    """
+    discord_ids = []
+    for target in targets.replace(',', ' ').split():
+        discord_id = target.removeprefix('<@').removeprefix('!').removesuffix('>')
+        if not discord_id.isdigit():
+            raise ValueError(f"{target} is neither a Discord user ID nor a user mention.")
+        discord_ids.append(discord_id)
+    if not discord_ids:
+        raise ValueError("No Discord users given.")
+    return list(dict.fromkeys(discord_ids))
+    
+async def resolve_targets(targets):
+    """Returns Discord IDs from IDs and user mentions, or from a registration date range.
+    
+    Date ranges are written as YYYY-MM-DD..YYYY-MM-DD, both ends inclusive.
+    """
+    if '..' not in targets:
+        return parse_discord_ids(targets)
+    try:
+        start, end = (date.fromisoformat(d.strip()) for d in targets.split('..', 1))
+    except ValueError:
+        raise ValueError("Date ranges are written as YYYY-MM-DD..YYYY-MM-DD.")
+    return await asyncio.to_thread(LOGSEC.registered_between, start, end)
+    
+def format_breaker():
+    breaker = LOGSEC.breaker
+    reply = f"Database circuit breaker: {breaker.state}, {breaker.failures} failures in a row"
+    if breaker.last_error is not None:
+        reply += f", last error: {getattr(breaker.last_error, 'orig', breaker.last_error)!r}"
+    return reply
+    
+def format_username_filter():
+    username_filter = LOGSEC.username_filter
+    if username_filter is None:
+        return "Username filter: disabled"
+    return (
+        f"Username filter: {len(username_filter)} of {username_filter.capacity} UUIDs, "
+        f"{username_filter.nbytes / 1024:.1f} KiB, {username_filter.fp_rate:.2%} false positives, "
+        f"built {discord.utils.format_dt(LOGSEC.username_filter_built, 'R')}"
+    )
+    
+def format_reconcile_report(report):
+    if report is None:
+        return "No reconciliation pass has run yet."
+    return (
+        f"Reconciliation pass finished {discord.utils.format_dt(report['finished'], 'R')} "
+        f"in {report['elapsed']:.2f}s.\n"
+        f"Scanned: {report['scanned']}\n"
+        f"Orphaned registrations removed: {report['orphaned']}\n"
+        f"Banned registrations removed: {report['banned']}\n"
+        f"Drifted registrations removed: {report['drifted']}\n"
+        f"Drifted registrations left for review, not offline players: {report['drift_reported']}"
+    )
+    
 if __name__ == "__main__":
     BANNED = BanFile("./conf/banlist.txt")
     ADMINS = AdminFile("./conf/adminlist.txt")
     REG = RegFile("./conf/server.closed")
+    
+    RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', 3600))
+    RECONCILE_CHUNK = int(os.getenv('RECONCILE_CHUNK', 500))
+    RECONCILE_PAUSE = float(os.getenv('RECONCILE_PAUSE', 0.5))
 
     LOGSEC = LogSec(
         os.getenv('DB_USERNAME'), 
         os.getenv('DB_PASSWORD'), 
         os.getenv('DB_HOST'), 
         os.getenv('DB_PORT'), 
-        os.getenv('DB_NAME')
+        os.getenv('DB_NAME'),
+        bcrypt_cost=int(os.getenv('BCRYPT_COST', 10)),
+        connect_timeout=int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        read_timeout=int(os.getenv('DB_READ_TIMEOUT', 10)),
+        write_timeout=int(os.getenv('DB_WRITE_TIMEOUT', 10)),
+        failure_threshold=int(os.getenv('DB_FAILURE_THRESHOLD', 5)),
+        reset_timeout=float(os.getenv('DB_RESET_TIMEOUT', 30))
     )
     
+    AUDIT = AuditWriter(
+        LOGSEC, 
+        interval=float(os.getenv('AUDIT_FLUSH_INTERVAL', 5)), 
+        max_buffer=int(os.getenv('AUDIT_BUFFER_SIZE', 100))
+    )
+    AUDIT_PAGE_SIZE = 10
+    
+    USERNAME_FILTER_FP_RATE = float(os.getenv('USERNAME_FILTER_FP_RATE', 0.01))
+    USERNAME_FILTER_REBUILD = float(os.getenv('USERNAME_FILTER_REBUILD', 3600))
+    if USERNAME_FILTER_FP_RATE > 0:
+        LOGSEC.build_username_filter(USERNAME_FILTER_FP_RATE)
+    
+    # Opt-in: coalesce registrations arriving within a few milliseconds into one transaction.
+    COALESCER = None
+    if float(os.getenv('REGISTER_COALESCE_MS', 0)) > 0:
+        COALESCER = RegistrationCoalescer(
+            LOGSEC, 
+            window=float(os.getenv('REGISTER_COALESCE_MS')) / 1000, 
+            max_batch=int(os.getenv('REGISTER_BATCH_SIZE', 64))
+        )
+    
     handler = logging.FileHandler(filename="./conf/discord.log", encoding="utf-8", mode="w")
     
     # Bot does not stop with default SIGTERM handling for some reason.
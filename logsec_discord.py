@@ -1,14 +1,23 @@
 import uuid
+import time
+import functools
+import asyncio
 import bcrypt
 import logging
-from datetime import date
+import threading
+import statistics
+from datetime import date, datetime, timezone
 
-from sqlalchemy import Table, Column, ForeignKey, Integer, VARCHAR
+from sqlalchemy import Table, Column, ForeignKey, Integer, VARCHAR, DateTime
 from sqlalchemy import inspect, create_engine, URL
-from sqlalchemy import select, insert, update, delete
+from sqlalchemy import select, insert, update, delete, func, bindparam
+from sqlalchemy.exc import IntegrityError, OperationalError, InterfaceError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm import declarative_base, mapped_column, Session
 
+from utils import BloomFilter
+
 logging.basicConfig(level=logging.DEBUG)
 
 class ValidationError(Exception):
@@ -16,21 +25,183 @@ class ValidationError(Exception):
     
 class DuplicateError(Exception):
     pass
+    
+class DatabaseUnavailable(Exception):
+    pass
+    
+class CircuitBreaker:
+    """Fails database calls fast while the database is down.
+    
+    Closed: calls go through, and failure_threshold failures in a row open the breaker.
+    Open: calls raise DatabaseUnavailable at once, until reset_timeout seconds have passed.
+    Half-open: one probe call goes through; success closes the breaker, failure opens it again.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probing = False
+        self._lock = threading.Lock()
+        
+    def _set_state(self, state):
+        if state != self.state:
+            last_error = getattr(self.last_error, 'orig', self.last_error)
+            logging.warning(f"Database circuit breaker {self.state} -> {state}. last_error={last_error!r}")
+            self.state = state
+        
+    def before_call(self):
+        """Raises DatabaseUnavailable if the call may not go through.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    raise DatabaseUnavailable(f"Database unavailable. last_error={self.last_error!r}")
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise DatabaseUnavailable(f"Database unavailable, probing. last_error={self.last_error!r}")
+                self._probing = True
+                
+    def record_success(self):
+        with self._lock:
+            self._probing = False
+            self.failures = 0
+            self._set_state(self.CLOSED)
+            
+    def record_failure(self, error):
+        with self._lock:
+            self._probing = False
+            self.failures += 1
+            self.last_error = error
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._set_state(self.OPEN)
+                
+    def release(self):
+        """Ends a call that neither proved nor disproved the database is up.
+        """
+        with self._lock:
+            self._probing = False
+            
+    def __repr__(self):
+        return f"{self.__class__.__name__}(state={self.state!r}, failures={self.failures})"
+        
+# MySQL client errors for a server that can't be reached or stopped answering: can't connect through the socket,
+# can't connect to the host, server has gone away, lost connection during query (read/write timeouts land here).
+CONNECTION_ERROR_CODES = {2002, 2003, 2006, 2013}
+
+def is_database_failure(error):
+    """Returns whether an error means the database couldn't be reached or didn't answer in time.
+    
+    Errors where the server answered and refused the statement, like deadlocks or lock wait timeouts, don't count.
+    """
+    if isinstance(error, PoolTimeoutError):
+        return True
+    if isinstance(error, (OperationalError, InterfaceError)):
+        if error.connection_invalidated:
+            return True
+        args = getattr(error.orig, 'args', ())
+        return bool(args) and args[0] in CONNECTION_ERROR_CODES
+    return False
+    
+def guarded(method):
+    """Runs a LogSec method through its circuit breaker, raising DatabaseUnavailable on database failures.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.breaker.before_call()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as e:
+            if not is_database_failure(e):
+                self.breaker.release()
+                raise
+            self.breaker.record_failure(e)
+            raise DatabaseUnavailable(f"Database unavailable. error={getattr(e, 'orig', e)!r}") from e
+        self.breaker.record_success()
+        return result
+    return wrapper
+    
+def offline_uuid(mc_username):
+    """Returns the offline-mode UUID of a Minecraft username, as a string.
+    """
+    # Generate UUID3 from lowercase name without stuffing.
+    class NULL_NAMESPACE: bytes = b''
+    return str(uuid.uuid3(NULL_NAMESPACE, 'OfflinePlayer:' + mc_username.lower()))
+
+def calibrate_bcrypt(target_ms=250, min_cost=4, max_cost=16, samples=3):
+    """Benchmarks bcrypt hashing on this host, from min_cost up, stopping once target_ms is exceeded.
+    
+    Returns the highest cost whose median hashing time stays within target_ms (min_cost if none do),
+    and a dict of median milliseconds per cost benchmarked.
+    """
+    
+    timings = {}
+    password = b'calibration'
+    for cost in range(min_cost, max_cost + 1):
+        salt = bcrypt.gensalt(cost, b'2a')
+        runs = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(password, salt)
+            runs.append((time.perf_counter() - start) * 1000)
+        timings[cost] = statistics.median(runs)
+        logging.debug(f"(calibrate_bcrypt) cost {cost}: {timings[cost]:.1f} ms")
+        if timings[cost] > target_ms:
+            break
+            
+    within = [cost for cost, ms in timings.items() if ms <= target_ms]
+    return max(within, default=min_cost), timings
 
 class LogSec:
 
-    def __init__(self, username, password, host, port, database):
+    def __init__(self, username, password, host, port, database, bcrypt_cost=10, engine=None,
+            connect_timeout=5, read_timeout=10, write_timeout=10, failure_threshold=5, reset_timeout=30):
         logging.debug("__init__ start.")
-        url_object = URL.create(
-            "mysql",
-            username=username,
-            password=password,
-            host=host,
-            port=port,
-            database=database 
-        )
-        logging.debug("Creating engine...")
-        self.engine = create_engine(url_object)
+        # LoginSecurity verifies $2a$ hashes of any cost, bcrypt accepts 4 to 31.
+        if not (4 <= bcrypt_cost <= 31):
+            raise ValueError(f"bcrypt cost must be 4 to 31. bcrypt_cost={bcrypt_cost}")
+        self.bcrypt_cost = bcrypt_cost
+        
+        # Negative cache of taken Minecraft UUIDs, see build_username_filter.
+        self.username_filter = None
+        self.username_filter_built = None
+        self._filter_lock = threading.Lock()
+        self._filter_pending = None
+        
+        if engine is None:
+            url_object = URL.create(
+                "mysql",
+                username=username,
+                password=password,
+                host=host,
+                port=port,
+                database=database 
+            )
+            logging.debug("Creating engine...")
+            # Deadlines in seconds for connecting, and for each read and write on the connection, so a slow or
+            # unreachable server fails the call instead of hanging it. pool_timeout bounds waiting for a
+            # free pooled connection.
+            engine = create_engine(
+                url_object,
+                connect_args={
+                    "connect_timeout": connect_timeout,
+                    "read_timeout": read_timeout,
+                    "write_timeout": write_timeout
+                },
+                pool_timeout=connect_timeout
+            )
+        self.engine = engine
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
         self.Base = declarative_base()
         logging.debug("Reflecting tables...")
         self.Base.metadata.reflect(self.engine,)
@@ -51,11 +222,59 @@ class LogSec:
                 def __repr__(self):
                     return f"Registration(id={self.discord_id!r}, unique_user_id={self.unique_user_id!r})"
             Registration.__table__.create(self.engine)
+            
+        if not inspect_object.has_table("lgds_audit"):
+            logging.debug("lgds_audit table does not exist, creating...")
+            class Audit(self.Base):
+                __tablename__ = "lgds_audit"
+                
+                id = mapped_column(Integer, primary_key=True, autoincrement=True)
+                created_at = mapped_column(DateTime, nullable=False, index=True)
+                actor_id = mapped_column(VARCHAR(32), nullable=False, index=True)
+                action = mapped_column(VARCHAR(32), nullable=False)
+                target = mapped_column(VARCHAR(255), index=True)
+                detail = mapped_column(VARCHAR(255))
+                
+                def __repr__(self):
+                    return f"Audit(id={self.id!r}, actor_id={self.actor_id!r}, action={self.action!r})"
+            Audit.__table__.create(self.engine)
 
         self.Registration = self.Base.metadata.tables['lgds_registration']
+        self.Audit = self.Base.metadata.tables['lgds_audit']
         self.LogSecPlayers = self.Base.metadata.tables['ls_players']
+        self._build_statements()
         logging.debug("__init__ done.")
+        
+    def _build_statements(self):
+        # Statements on hot paths are built once with bound parameters and run on a plain Connection.
+        # Reusing the same construct lets the engine's compiled cache answer without rebuilding and
+        # re-keying the statement, and skipping the Session and ORM result mapping leaves plain Row tuples.
+        R, P = self.Registration, self.LogSecPlayers
+        
+        self._select_player = (
+            select(P.c.unique_user_id, P.c.last_name)
+            .where(P.c.unique_user_id == bindparam('unique_user_id'))
+        )
+        self._select_binding = (
+            select(R.c.discord_id, R.c.unique_user_id)
+            .where(R.c.discord_id == bindparam('discord_id'))
+        )
+        self._insert_player = insert(P)
+        self._insert_binding = insert(R)
+        self._delete_player = delete(P).where(P.c.unique_user_id == bindparam('unique_user_id'))
+        self._delete_binding = delete(R).where(R.c.unique_user_id == bindparam('unique_user_id'))
+        
+        self._select_registered = select(R.c.discord_id, P.c.last_name, P.c.registration_date).join_from(R, P)
+        self._select_registration = self._select_registered.where(R.c.discord_id == bindparam('discord_id'))
+        self._select_registered_between = (
+            select(R.c.discord_id)
+            .join_from(R, P)
+            .where(P.c.registration_date.between(bindparam('start'), bindparam('end')))
+        )
+        self._select_usernames = select(P.c.last_name, P.c.registration_date)
+        self._select_username = self._select_usernames.where(P.c.unique_user_id == bindparam('unique_user_id'))
 
+    @guarded
     def register(self, discord_id, mc_username, password):
         """Registers Minecraft username bound to Discord user id.
         
@@ -65,41 +284,60 @@ class LogSec:
         
         logging.debug(f"(register) discord id, mc_username: {discord_id} {mc_username}")
         
+        player, registration = self.prepare_registration(discord_id, mc_username, password)
+        self._register_prepared(player, registration)
+        
+    def prepare_registration(self, discord_id, mc_username, password):
+        """Validates and hashes a registration without touching the database.
+        
+        Returns rows for ls_players and lgds_registration, to be passed on to register_many.
+        Raises ValidationError if either Minecraft username or password don't meet criteria.
+        """
+        
         # Validate Minecraft username and password.
         if not (3 <= len(mc_username) <= 16) and ' ' not in mc_username:
             raise ValidationError("Minecraft username must be 3 to 16 characters long and without spaces.")
         if not (6 <= len(password) <= 32) and ' ' not in password:
             raise ValidationError("Password must be 6 to 32 characters long and without spaces.")
         
-        # Generate UUID3 from lowercase name without stuffing.
-        class NULL_NAMESPACE: bytes = b''
-        mc_username_uuid = uuid.uuid3(NULL_NAMESPACE, 'OfflinePlayer:' + mc_username.lower())
+        mc_username_uuid = offline_uuid(mc_username)
         
-        # Bcrypt 10 rounds variant 2a, which is what LoginSecurity uses.
-        salt = bcrypt.gensalt(10, b'2a')
+        # Bcrypt variant 2a, which is what LoginSecurity uses.
+        salt = bcrypt.gensalt(self.bcrypt_cost, b'2a')
         password_hash = bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
         
         logging.debug(f"Generated uuid and password hash: {mc_username_uuid} {password_hash}")
-            
-        with Session(self.engine) as session:
-            # Returns cursor, which apparently can only be iterated once, from then it is exhausted.
-            # So assign all values to variable to use it multiple times.
-            # .mappings().all() returns a list of dict, where key is the column name.
+        
+        player = {
+            "unique_user_id": mc_username_uuid, 
+            "last_name": mc_username, 
+            "password": password_hash, 
+            "hashing_algorithm": 7, 
+            "registration_date": date.today(), 
+            "optlock": 1, 
+            "uuid_mode": "O"
+        }
+        registration = {
+            "discord_id": discord_id,
+            "unique_user_id": mc_username_uuid
+        }
+        return player, registration
+        
+    def _register_prepared(self, player, registration):
+        with self.engine.begin() as connection:
             # Allow only one discord id and minecraft uuid (lowercase username) in database.
             
             # Check if Minecraft username exist in LoginSecurity player table.
-            existing_uuid = session.execute(
-                select(self.LogSecPlayers.c.unique_user_id, self.LogSecPlayers.c.last_name)
-                .where(self.LogSecPlayers.c.unique_user_id==str(mc_username_uuid))
-            ).mappings().all()
+            existing_uuid = connection.execute(
+                self._select_player, {"unique_user_id": player['unique_user_id']}
+            ).first()
             
             logging.debug(f"Result of existing uuid query: {existing_uuid}")
             
             # Check if Discord ID exist in database.
-            existing_discord_id = session.execute(
-                select(self.Registration.c.discord_id, self.Registration.c.unique_user_id)
-                .where(self.Registration.c.discord_id==discord_id)
-            ).mappings().all()
+            existing_discord_id = connection.execute(
+                self._select_binding, {"discord_id": registration['discord_id']}
+            ).first()
             
             logging.debug(f"Result of existing discord id query: {existing_discord_id}")
             
@@ -107,129 +345,487 @@ class LogSec:
             if existing_uuid:
                 raise DuplicateError(
                     "Minecraft UUID already exist in database. "
-                    f"UUID={existing_uuid[0]['unique_user_id']}, username={existing_uuid[0]['last_name']}")
+                    f"UUID={existing_uuid.unique_user_id}, username={existing_uuid.last_name}")
             elif existing_discord_id:
                 raise DuplicateError(
                     "Discord ID already exist in database. "
-                    f"UUID={existing_discord_id[0]['discord_id']}, username={existing_discord_id[0]['unique_user_id']}")
+                    f"UUID={existing_discord_id.discord_id}, username={existing_discord_id.unique_user_id}")
 
             # Create a LoginSecurity username entry.
-            session.execute(
-                insert(self.LogSecPlayers),
-                [{
-                    "unique_user_id": str(mc_username_uuid), 
-                    "last_name": mc_username, 
-                    "password": password_hash, 
-                    "hashing_algorithm": 7, 
-                    "registration_date": date.today(), 
-                    "optlock": 1, 
-                    "uuid_mode": "O"
-                }]
-            )
+            connection.execute(self._insert_player, player)
             
             # Create a mapping between Discord ID and Minecraft username.
-            session.execute(
-                insert(self.Registration),
-                [{
-                    "discord_id": discord_id,
-                    "unique_user_id": mc_username_uuid
-                }]
-            )
+            connection.execute(self._insert_binding, registration)
             
-            # Commit rows to database.
-            session.commit()
+            # Rows are committed to database when the block exits.
             
+        self._filter_add(player['unique_user_id'])
+            
+    @guarded
+    def register_many(self, registrations):
+        """Writes many registrations from prepare_registration in one transaction with multi-row INSERTs.
+        
+        Returns a list holding, for each registration, None if it was written or the DuplicateError that kept it out.
+        """
+        
+        logging.debug(f"(register_many) {len(registrations)} registrations")
+        
+        results = [None] * len(registrations)
+        try:
+            with Session(self.engine) as session:
+                existing_uuids = set(session.execute(
+                    select(self.LogSecPlayers.c.unique_user_id)
+                    .where(self.LogSecPlayers.c.unique_user_id.in_(
+                        [player['unique_user_id'] for player, _ in registrations]))
+                ).scalars().all())
+                existing_discord_ids = set(session.execute(
+                    select(self.Registration.c.discord_id)
+                    .where(self.Registration.c.discord_id.in_(
+                        [registration['discord_id'] for _, registration in registrations]))
+                ).scalars().all())
+                
+                # Registrations earlier in the batch win over later ones for the same UUID or Discord ID.
+                players, bindings = [], []
+                for i, (player, registration) in enumerate(registrations):
+                    if player['unique_user_id'] in existing_uuids:
+                        results[i] = DuplicateError(
+                            "Minecraft UUID already exist in database. "
+                            f"UUID={player['unique_user_id']}, username={player['last_name']}")
+                    elif registration['discord_id'] in existing_discord_ids:
+                        results[i] = DuplicateError(
+                            "Discord ID already exist in database. "
+                            f"discord_id={registration['discord_id']}")
+                    else:
+                        existing_uuids.add(player['unique_user_id'])
+                        existing_discord_ids.add(registration['discord_id'])
+                        players.append(player)
+                        bindings.append(registration)
+                
+                if players:
+                    session.execute(insert(self.LogSecPlayers).values(players))
+                    session.execute(insert(self.Registration).values(bindings))
+                session.commit()
+                
+            for player in players:
+                self._filter_add(player['unique_user_id'])
+        except IntegrityError:
+            # Another writer got in between the checks and the INSERTs. Fall back to one transaction per row
+            # so only the conflicting registrations fail.
+            logging.debug("(register_many) batch conflicted, retrying row by row")
+            for i, (player, registration) in enumerate(registrations):
+                if results[i] is not None:
+                    continue
+                try:
+                    self._register_prepared(player, registration)
+                except DuplicateError as e:
+                    results[i] = e
+                except IntegrityError as e:
+                    results[i] = DuplicateError(f"Registration conflicts with existing row. {e.orig}")
+        
+        return results
+            
+    @guarded
     def unregister(self, discord_id):
         """Removes registered Minecraft account bound to Discord user ID.
         """
         
         logging.debug(f"(unregister) discord id: {discord_id}")
         
-        with Session(self.engine) as session:
+        with self.engine.begin() as connection:
             # Check if Discord ID exist in database.
-            existing_discord_id = session.execute(
-                select(self.Registration.c.discord_id, self.Registration.c.unique_user_id)
-                .where(self.Registration.c.discord_id==discord_id)
-            ).mappings().all()
+            existing_discord_id = connection.execute(self._select_binding, {"discord_id": discord_id}).first()
             
             # The user did not register a username.
             if not existing_discord_id:
                 raise KeyError(f"Discord ID not found in database. discord_id={discord_id}")
                 
-            mc_username_uuid = existing_discord_id[0]['unique_user_id']
+            mc_username_uuid = existing_discord_id.unique_user_id
             
             # Check if Minecraft username bound to Discord ID exist in database.
-            existing_uuid = session.execute(
-                select(self.LogSecPlayers.c.unique_user_id)
-                .where(self.LogSecPlayers.c.unique_user_id==str(mc_username_uuid))
-            ).mappings().all()
-            
+            existing_uuid = connection.execute(self._select_player, {"unique_user_id": mc_username_uuid}).first()
             
             if not existing_uuid:
                 # Somehow, the bound username does not exist. Delete strange entry in lgds_registration table.
+                connection.execute(self._delete_binding, {"unique_user_id": mc_username_uuid})
+            else:
+                # Entry in lgds_registration will be deleted as ForeignKey unique_user_id's deletion is cascaded.
+                connection.execute(self._delete_player, {"unique_user_id": mc_username_uuid})
+            
+    @guarded
+    def unregister_many(self, discord_ids, batch_size=500):
+        """Removes registered Minecraft accounts bound to many Discord user IDs in one transaction.
+        
+        Unknown Discord IDs are skipped. Returns the removed registrations as dicts of discord_id and last_name.
+        """
+        
+        discord_ids = list(dict.fromkeys(str(discord_id) for discord_id in discord_ids))
+        logging.debug(f"(unregister_many) {len(discord_ids)} discord ids")
+        
+        removed = []
+        with Session(self.engine) as session:
+            for i in range(0, len(discord_ids), batch_size):
+                batch = discord_ids[i:i+batch_size]
+                
+                existing = session.execute(
+                    select(
+                        self.Registration.c.discord_id, 
+                        self.Registration.c.unique_user_id, 
+                        self.LogSecPlayers.c.last_name
+                    )
+                    .join_from(
+                        self.Registration, self.LogSecPlayers, 
+                        self.Registration.c.unique_user_id == self.LogSecPlayers.c.unique_user_id, 
+                        isouter=True
+                    )
+                    .where(self.Registration.c.discord_id.in_(batch))
+                ).mappings().all()
+                if not existing:
+                    continue
+                
+                # Registrations are deleted before players so orphaned registrations are removed as well.
                 session.execute(
                     delete(self.Registration)
-                    .where(self.Registration.c.unique_user_id == mc_username_uuid)
+                    .where(self.Registration.c.discord_id.in_([row['discord_id'] for row in existing]))
                 )
-            else:
-                # Entry in lgds_registration will be deleted as ForeignKey unique_user_id's deletion is cascaded.
                 session.execute(
                     delete(self.LogSecPlayers)
-                    .where(self.LogSecPlayers.c.unique_user_id == mc_username_uuid)
+                    .where(self.LogSecPlayers.c.unique_user_id.in_([row['unique_user_id'] for row in existing]))
                 )
+                removed += [{"discord_id": row['discord_id'], "last_name": row['last_name']} for row in existing]
                 
             session.commit()
             
+        logging.debug(f"Result of unregister_many: {len(removed)} removed")
+        return removed
+            
+    @guarded
+    def registered_between(self, start, end):
+        """Returns Discord IDs of players registered through this module from start to end date, inclusive.
+        """
+        with self.engine.connect() as connection:
+            return connection.execute(self._select_registered_between, {"start": start, "end": end}).scalars().all()
+            
     @property
+    @guarded
     def registered(self):
         """Returns players registered through this module, excluding pre-existing players in LoginSecurity.
+        
+        Rows are tuples of discord_id, last_name and registration_date, also accessible as attributes.
         """
-        with Session(self.engine) as session:
-            registrations = session.execute(
-                select(
-                    self.Registration.c.discord_id, 
-                    self.LogSecPlayers.c.last_name, 
-                    self.LogSecPlayers.c.registration_date
-                )
-                .join_from(self.Registration, self.LogSecPlayers)
-            ).mappings().all()
-            return registrations
+        with self.engine.connect() as connection:
+            return connection.execute(self._select_registered).all()
             
     @property
+    @guarded
     def usernames(self):
         """Returns all usernames including pre-existing players in LoginSecurity.
+        
+        Rows are tuples of last_name and registration_date, also accessible as attributes.
         """
-        with Session(self.engine) as session:
-            registrations = session.execute(
-                select(self.LogSecPlayers.c.last_name, self.LogSecPlayers.c.registration_date)
-            ).mappings().all()
-            return registrations
+        with self.engine.connect() as connection:
+            return connection.execute(self._select_usernames).all()
         
+    @guarded
     def lookup_discord(self, discord_id):
         """Returns registration of Discord user.
+        
+        Rows are tuples of discord_id, last_name and registration_date, also accessible as attributes.
         """
-        with Session(self.engine) as session:
-            registrations = session.execute(
-                select(
-                    self.Registration.c.discord_id, 
-                    self.LogSecPlayers.c.last_name, 
-                    self.LogSecPlayers.c.registration_date
-                )
-                .join_from(self.Registration, self.LogSecPlayers)
-                .where(self.Registration.c.discord_id==discord_id)
-            ).mappings().all()
-            return registrations
+        with self.engine.connect() as connection:
+            return connection.execute(self._select_registration, {"discord_id": discord_id}).all()
             
     def lookup_username(self, mc_username):
         """Returns row where UUID of username matches.
+        
+        Rows are tuples of last_name and registration_date, also accessible as attributes.
+        Skips the database when the username filter rules the UUID out.
+        """
+        mc_username_uuid = offline_uuid(mc_username)
+        
+        username_filter = self.username_filter
+        if username_filter is not None and mc_username_uuid not in username_filter:
+            return []
+        return self._lookup_uuid(mc_username_uuid)
+        
+    @guarded
+    def _lookup_uuid(self, mc_username_uuid):
+        with self.engine.connect() as connection:
+            return connection.execute(self._select_username, {"unique_user_id": mc_username_uuid}).all()
+            
+    @guarded
+    def write_audit(self, entries):
+        """Writes audit entries, dicts of created_at, actor_id, action, target and detail, in one transaction.
+        """
+        with Session(self.engine) as session:
+            session.execute(insert(self.Audit).values(entries))
+            session.commit()
+            
+    @guarded
+    def audit_log(self, page=1, per_page=10, discord_id=None):
+        """Returns a page of audit entries, newest first, optionally only those by or about a Discord user.
+        """
+        query = (
+            select(
+                self.Audit.c.id, 
+                self.Audit.c.created_at, 
+                self.Audit.c.actor_id, 
+                self.Audit.c.action, 
+                self.Audit.c.target, 
+                self.Audit.c.detail
+            )
+            .order_by(self.Audit.c.id.desc())
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+        if discord_id is not None:
+            query = query.where((self.Audit.c.actor_id == discord_id) | (self.Audit.c.target == discord_id))
+        with Session(self.engine) as session:
+            entries = session.execute(query).mappings().all()
+            return entries
+            
+    @guarded
+    def build_username_filter(self, fp_rate=0.01, chunk_size=10000):
+        """Builds a Bloom filter of every Minecraft UUID in ls_players, streamed in chunks, and swaps it in.
+        
+        lookup_username then answers for UUIDs absent from the filter without a query. Registrations made while
+        building are carried over. Unregistered UUIDs stay in the filter until the next build, which only costs
+        a query; players created in-game are only picked up by the next build.
+        """
+        
+        logging.debug(f"(build_username_filter) fp_rate: {fp_rate}")
+        
+        with self._filter_lock:
+            self._filter_pending = set()
+            
+        try:
+            with self.engine.connect() as connection:
+                count = connection.execute(select(func.count()).select_from(self.LogSecPlayers)).scalar_one()
+                # Leave headroom for registrations until the next build.
+                username_filter = BloomFilter(max(1024, int(count * 1.25)), fp_rate)
+                
+                result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                    select(self.LogSecPlayers.c.unique_user_id)
+                )
+                for partition in result.scalars().partitions():
+                    for mc_username_uuid in partition:
+                        username_filter.add(mc_username_uuid)
+        except:
+            with self._filter_lock:
+                self._filter_pending = None
+            raise
+                    
+        with self._filter_lock:
+            for mc_username_uuid in self._filter_pending:
+                username_filter.add(mc_username_uuid)
+            self._filter_pending = None
+            self.username_filter = username_filter
+            self.username_filter_built = datetime.now(timezone.utc)
+            
+        logging.info(f"Built username filter: {username_filter}")
+        return username_filter
+        
+    def _filter_add(self, mc_username_uuid):
+        with self._filter_lock:
+            if self.username_filter is not None:
+                self.username_filter.add(mc_username_uuid)
+            if self._filter_pending is not None:
+                self._filter_pending.add(mc_username_uuid)
+            
+    @guarded
+    def reconcile(self, banned, after=None, limit=500):
+        """Checks one page of lgds_registration, ordered by Discord ID, and repairs what is wrong with it.
+        
+        Pages are keyset-paginated: pass the returned Discord ID as `after` to fetch the next page.
+        Rows are repaired in one transaction with batched DELETEs:
+          orphaned -- bound Minecraft UUID no longer exists in ls_players; registration is deleted.
+          banned -- Discord ID is in `banned`; registration and its player are deleted.
+          drifted -- bound player's name does not match its offline UUID. Offline players (uuid_mode 'O'), which this
+            module creates, are deleted together with their registration, as unregistering would. Other players are
+            left alone and only reported, since deleting just the registration would strand a live account.
+        
+        Returns a tuple of the last Discord ID seen (None when there are no more pages) and a dict of counts.
         """
-        # Generate UUID3 from lowercase name without stuffing.
-        class NULL_NAMESPACE: bytes = b''
-        mc_username_uuid = str(uuid.uuid3(NULL_NAMESPACE, 'OfflinePlayer:' + mc_username.lower()))
+        
+        logging.debug(f"(reconcile) after, limit: {after} {limit}")
+        
+        query = (
+            select(
+                self.Registration.c.discord_id,
+                self.Registration.c.unique_user_id,
+                self.LogSecPlayers.c.unique_user_id.label('player_uuid'),
+                self.LogSecPlayers.c.last_name,
+                self.LogSecPlayers.c.uuid_mode
+            )
+            .join_from(
+                self.Registration, self.LogSecPlayers,
+                self.Registration.c.unique_user_id == self.LogSecPlayers.c.unique_user_id,
+                isouter=True
+            )
+            .order_by(self.Registration.c.discord_id)
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(self.Registration.c.discord_id > after)
         
         with Session(self.engine) as session:
-            registrations = session.execute(
-                select(self.LogSecPlayers.c.last_name, self.LogSecPlayers.c.registration_date)
-                .where(self.LogSecPlayers.c.unique_user_id==mc_username_uuid)
-            ).mappings().all()
-            return registrations
\ No newline at end of file
+            rows = session.execute(query).mappings().all()
+            
+            orphaned, banned_ids, drifted, drift_reported, stale_uuids = [], [], [], [], []
+            for row in rows:
+                if row['player_uuid'] is None:
+                    orphaned.append(row['discord_id'])
+                elif row['discord_id'] in banned:
+                    banned_ids.append(row['discord_id'])
+                    stale_uuids.append(row['unique_user_id'])
+                elif row['last_name'] is None:
+                    # LoginSecurity allows players without a name; there is nothing to compare the UUID with.
+                    continue
+                elif offline_uuid(row['last_name']) != row['unique_user_id']:
+                    if row['uuid_mode'] == 'O':
+                        drifted.append(row['discord_id'])
+                        stale_uuids.append(row['unique_user_id'])
+                    else:
+                        drift_reported.append(row['discord_id'])
+            
+            if drift_reported:
+                logging.warning(f"Registrations bound to players whose name doesn't match their UUID: {drift_reported}")
+            
+            # Registrations are deleted before players so this works with or without the cascading foreign key.
+            stale_ids = orphaned + banned_ids + drifted
+            if stale_ids:
+                session.execute(
+                    delete(self.Registration)
+                    .where(self.Registration.c.discord_id.in_(stale_ids))
+                )
+            if stale_uuids:
+                session.execute(
+                    delete(self.LogSecPlayers)
+                    .where(self.LogSecPlayers.c.unique_user_id.in_(stale_uuids))
+                )
+            
+            session.commit()
+        
+        counts = {
+            "scanned": len(rows),
+            "orphaned": len(orphaned),
+            "banned": len(banned_ids),
+            "drifted": len(drifted),
+            "drift_reported": len(drift_reported)
+        }
+        logging.debug(f"Result of reconcile page: {counts}")
+        
+        last = rows[-1]['discord_id'] if len(rows) == limit else None
+        return last, counts
+
+
+class RegistrationCoalescer:
+    """Collects registrations arriving within a short window and writes them to LogSec in one transaction.
+    
+    Each caller awaits its own registration, which raises DuplicateError or ValidationError as LogSec.register would.
+    """
+    
+    def __init__(self, logsec, window=0.005, max_batch=64):
+        self.logsec = logsec
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._full = asyncio.Event()
+        self._flusher = None
+        
+    async def register(self, discord_id, mc_username, password):
+        # Hashing is slow, so do it off the event loop before joining a batch.
+        prepared = await asyncio.to_thread(self.logsec.prepare_registration, discord_id, mc_username, password)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((prepared, future))
+        if self._flusher is None:
+            self._full.clear()
+            self._flusher = asyncio.create_task(self._flush())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        await future
+        
+    async def _flush(self):
+        try:
+            await asyncio.wait_for(self._full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        
+        # Registrations arriving from here on start the next window, while this one is written.
+        batch, self._pending = self._pending, []
+        self._flusher = None
+        
+        for i in range(0, len(batch), self.max_batch):
+            chunk = batch[i:i+self.max_batch]
+            try:
+                results = await asyncio.to_thread(self.logsec.register_many, [prepared for prepared, _ in chunk])
+            except Exception as e:
+                results = [e] * len(chunk)
+            
+            for (_, future), result in zip(chunk, results):
+                if future.done():
+                    continue
+                if result is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(result)
+
+
+class AuditWriter:
+    """Buffers audit entries and writes them to LogSec in batches, every interval or once max_buffer are waiting.
+    
+    Recording never waits on the database. Call close to write what's left.
+    """
+    
+    def __init__(self, logsec, interval=5, max_buffer=100):
+        self.logsec = logsec
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._full = asyncio.Event()
+        self._task = None
+        
+    def record(self, actor_id, action, target=None, detail=None):
+        self._buffer.append({
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            "actor_id": str(actor_id),
+            "action": action,
+            "target": None if target is None else str(target)[:255],
+            "detail": None if detail is None else str(detail)[:255]
+        })
+        if len(self._buffer) >= self.max_buffer:
+            self._full.set()
+            
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+            
+    async def flush(self):
+        entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+        try:
+            await asyncio.to_thread(self.logsec.write_audit, entries)
+        except Exception:
+            logging.exception(f"Failed to write {len(entries)} audit entries, keeping them for the next flush.")
+            # Don't grow without bound while the database is away, keep the newest entries.
+            self._buffer = (entries + self._buffer)[-self.max_buffer * 10:]
+            
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -1,4 +1,6 @@
 import os
+import math
+import hashlib
 
 class ListFile:
     """Base class for inheritance, for tracking something in list, like Discord IDs. Saved to a file.
@@ -22,6 +24,24 @@ class ListFile:
     def _remove(self, item):
         self.item_set.remove(str(item))
         self.save()
+        
+    def _add_many(self, items):
+        """Adds items and saves once. Returns the items that weren't in the list.
+        """
+        added = {str(item) for item in items} - self.item_set
+        if added:
+            self.item_set |= added
+            self.save()
+        return added
+        
+    def _remove_many(self, items):
+        """Removes items and saves once. Returns the items that were in the list.
+        """
+        removed = {str(item) for item in items} & self.item_set
+        if removed:
+            self.item_set -= removed
+            self.save()
+        return removed
 
     def reload(self, filename=None):
         filename = filename or self.filename
@@ -61,6 +81,12 @@ class BanFile(ListFile):
     def unban(self, discord_id):
         return super()._remove(discord_id)
         
+    def ban_many(self, discord_ids):
+        return super()._add_many(discord_ids)
+        
+    def unban_many(self, discord_ids):
+        return super()._remove_many(discord_ids)
+        
     @property
     def banned(self):
         return super()._items
@@ -106,4 +132,49 @@ class RegFile:
         
     def __repr__(self):
         return f"{self.__class__.__name__}(is_open={self.is_open})"
-        
\ No newline at end of file
+        
+        
+class BloomFilter:
+    """Compact probabilistic set of strings. Answers whether an item is definitely absent or possibly present.
+    
+    Items can't be removed; rebuild the filter to drop them.
+    """
+    
+    def __init__(self, capacity, fp_rate=0.01):
+        if not (0 < fp_rate < 1):
+            raise ValueError(f"False-positive rate must be between 0 and 1. fp_rate={fp_rate}")
+        self.capacity = max(1, capacity)
+        self.fp_rate = fp_rate
+        # Optimal bit count and hash count for the capacity and false-positive rate.
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        
+    def _positions(self, item):
+        # Double hashing: derive every position from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+        
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+        
+    def __len__(self):
+        return self.count
+        
+    @property
+    def nbytes(self):
+        return len(self.bits)
+        
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(count={self.count}, capacity={self.capacity}, "
+            f"fp_rate={self.fp_rate}, nbytes={self.nbytes})"
+        )